@@ -0,0 +1,46 @@
+import hashlib
+import hmac
+import time
+from typing import Optional
+from fastapi import Header, Response
+from pymongo import ReadPreference
+from app.core.security import SECRET_KEY
+from app.database import LISTING_READ_PREFERENCE, READ_MAX_STALENESS_S
+
+# Write endpoints stamp this header and the frontend echoes it on later calls.
+# It is a heuristic, not a causal-consistency guarantee: while the stamp is
+# recent, that caller's listings read from the primary instead of a secondary.
+LAST_WRITE_HEADER = "X-LifeLink-Last-Write"
+
+# Max staleness plus one 10s heartbeat. maxStalenessSeconds is the driver's
+# estimate of secondary lag, so this window is a best-effort bound, not a proof
+PRIMARY_AFTER_WRITE_WINDOW_MS = (READ_MAX_STALENESS_S + 10) * 1000
+
+
+def _sign(written_at: str) -> str:
+    return hmac.new(SECRET_KEY.encode("utf-8"), written_at.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def mark_write(response: Response):
+    # Signed so callers cannot mint stamps that pin every listing to the primary
+    written_at = str(int(time.time() * 1000))
+    response.headers[LAST_WRITE_HEADER] = f"{written_at}.{_sign(written_at)}"
+
+
+def listing_read_preference(x_lifelink_last_write: Optional[str] = Header(None)):
+    """
+    Read preference for dashboard listings.
+
+    Secondary reads by default. If the caller presents a valid stamp from a
+    write in the last PRIMARY_AFTER_WRITE_WINDOW_MS, read from the primary so
+    the caller's own write is very likely visible.
+    """
+    if not x_lifelink_last_write or "." not in x_lifelink_last_write:
+        return LISTING_READ_PREFERENCE
+    written_at, signature = x_lifelink_last_write.split(".", 1)
+    if not written_at.isdigit() or not hmac.compare_digest(signature, _sign(written_at)):
+        return LISTING_READ_PREFERENCE
+    age_ms = int(time.time() * 1000) - int(written_at)
+    if 0 <= age_ms < PRIMARY_AFTER_WRITE_WINDOW_MS:
+        return ReadPreference.PRIMARY
+    return LISTING_READ_PREFERENCE
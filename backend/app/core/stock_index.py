@@ -0,0 +1,396 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+import numpy as np
+from bson import ObjectId
+from app.database import LISTING_READ_PREFERENCE
+
+# Compatibility tables map recipient group -> donor groups it can safely receive
+
+# Red cells: O- is the universal donor
+RBC_COMPATIBILITY = {
+    "O-": ["O-"],
+    "O+": ["O+", "O-"],
+    "A-": ["A-", "O-"],
+    "A+": ["A+", "A-", "O+", "O-"],
+    "B-": ["B-", "O-"],
+    "B+": ["B+", "B-", "O+", "O-"],
+    "AB-": ["AB-", "A-", "B-", "O-"],
+    "AB+": ["AB+", "AB-", "A+", "A-", "B+", "B-", "O+", "O-"],
+}
+
+# Plasma runs the other way: AB is the universal donor, Rh does not apply
+PLASMA_COMPATIBILITY = {
+    "O-": ["O-", "O+", "A-", "A+", "B-", "B+", "AB-", "AB+"],
+    "O+": ["O+", "O-", "A+", "A-", "B+", "B-", "AB+", "AB-"],
+    "A-": ["A-", "A+", "AB-", "AB+"],
+    "A+": ["A+", "A-", "AB+", "AB-"],
+    "B-": ["B-", "B+", "AB-", "AB+"],
+    "B+": ["B+", "B-", "AB+", "AB-"],
+    "AB-": ["AB-", "AB+"],
+    "AB+": ["AB+", "AB-"],
+}
+
+# Platelets: plasma-compatible ABO, Rh- recipients only take Rh- units
+PLATELET_COMPATIBILITY = {
+    "O-": ["O-", "A-", "B-", "AB-"],
+    "O+": ["O+", "O-", "A+", "A-", "B+", "B-", "AB+", "AB-"],
+    "A-": ["A-", "AB-"],
+    "A+": ["A+", "A-", "AB+", "AB-"],
+    "B-": ["B-", "AB-"],
+    "B+": ["B+", "B-", "AB+", "AB-"],
+    "AB-": ["AB-"],
+    "AB+": ["AB+", "AB-"],
+}
+
+# Whole blood carries both cells and plasma, so it must be ABO-identical
+WHOLE_BLOOD_COMPATIBILITY = {
+    "O-": ["O-"],
+    "O+": ["O+", "O-"],
+    "A-": ["A-"],
+    "A+": ["A+", "A-"],
+    "B-": ["B-"],
+    "B+": ["B+", "B-"],
+    "AB-": ["AB-"],
+    "AB+": ["AB+", "AB-"],
+}
+
+COMPONENT_COMPATIBILITY = {
+    "Whole Blood": WHOLE_BLOOD_COMPATIBILITY,
+    "Packed Red Cells": RBC_COMPATIBILITY,
+    "Platelets": PLATELET_COMPATIBILITY,
+    "Plasma": PLASMA_COMPATIBILITY,
+}
+COMPONENT_TYPES = list(COMPONENT_COMPATIBILITY.keys())
+
+BLOOD_GROUPS = list(RBC_COMPATIBILITY.keys())
+_GROUP_CODES = {g: i for i, g in enumerate(BLOOD_GROUPS)}
+_UNKNOWN_GROUP = np.uint8(255)
+
+# Raw 12-byte ObjectId, kept fixed width so ids cost 12 B/row instead of a Python str
+_ID_DTYPE = np.dtype("S12")
+_NO_EXPIRY = np.iinfo(np.int64).max
+_INITIAL_CAPACITY = 1024
+# Rows per append during a reload; keeps each blocking step on the event loop short
+_LOAD_BATCH = 10_000
+
+# Max age of the snapshot before a match triggers a background reload from Mongo
+STOCK_SNAPSHOT_TTL_S = int(os.getenv("STOCK_SNAPSHOT_TTL_S", "30"))
+
+
+def _epoch(dt: datetime) -> int:
+    # Mongo hands back naive UTC datetimes, treat them as UTC
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _key(unit_id) -> bytes:
+    if isinstance(unit_id, ObjectId):
+        return unit_id.binary
+    return ObjectId(unit_id).binary
+
+
+class StockSnapshot:
+    """
+    Columnar in-memory view of Available units across the network.
+
+    Each unit is one row; institution, blood group and component are stored as
+    small integer codes, expiry as epoch seconds and the unit id as its raw
+    12-byte ObjectId, so a row costs about 44 B including the sorted id index
+    used to find rows on discard. A match over the whole network is a handful
+    of vectorized passes instead of loading documents.
+
+    Writes made through this process are applied immediately. Writes made by
+    other workers, serverless instances or outside the API are picked up when
+    the snapshot is reloaded. The first match after start-up waits for the
+    load; after that a stale snapshot keeps serving while a background task
+    reloads it from a secondary, so results may be up to ``ttl_seconds`` plus
+    the reload time plus the secondary's replication lag behind Mongo.
+    """
+
+    def __init__(self, ttl_seconds: int = STOCK_SNAPSHOT_TTL_S):
+        self.ttl_seconds = ttl_seconds
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._journal: Optional[list] = None
+        self._reset()
+
+    def _reset(self, capacity: int = _INITIAL_CAPACITY):
+        self._size = 0
+        self._dead = 0
+        self._inst = np.zeros(capacity, dtype=np.int32)
+        self._group = np.zeros(capacity, dtype=np.uint8)
+        self._comp = np.zeros(capacity, dtype=np.uint16)
+        self._expiry = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._ids = np.zeros(capacity, dtype=_ID_DTYPE)
+        # Sorted ids of live rows and the row each one lives in
+        self._index_ids = np.empty(0, dtype=_ID_DTYPE)
+        self._index_rows = np.empty(0, dtype=np.int32)
+        self._institutions: List[str] = []
+        self._institution_codes = {}
+        self._components: List[str] = []
+        self._component_codes = {}
+
+    def _columns(self):
+        return (self._inst, self._group, self._comp, self._expiry, self._alive, self._ids)
+
+    def __len__(self) -> int:
+        return self._size - self._dead
+
+    def _intern(self, value: str, values: List[str], codes: dict) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = len(values)
+            values.append(value)
+            codes[value] = code
+        return code
+
+    def _grow(self, needed: int):
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        n = self._size
+        grown = []
+        for col in self._columns():
+            new = np.zeros(capacity, dtype=col.dtype)
+            new[:n] = col[:n]
+            grown.append(new)
+        self._inst, self._group, self._comp, self._expiry, self._alive, self._ids = grown
+
+    def add(self, unit_id, institution_id: str, blood_group: str,
+            component_type: str, expiry_date: datetime):
+        self.add_many([(unit_id, institution_id, blood_group, component_type, expiry_date)])
+
+    def add_units(self, units: Iterable):
+        self.add_many(
+            (u.id, u.institution_id, u.blood_group, u.component_type, u.expiry_date)
+            for u in units
+        )
+
+    def add_many(self, records: Iterable[tuple]):
+        """Add ``(unit_id, institution_id, blood_group, component_type, expiry_date)`` rows."""
+        records = list(records)
+        if not records:
+            return
+        if self._journal is not None:
+            self._journal.append(("add", records))
+
+        keys = np.array([_key(r[0]) for r in records], dtype=_ID_DTYPE)
+        # Re-adding a live unit replaces its row
+        self._discard_keys(keys)
+        start = self._append(records, keys)
+
+        order = np.argsort(keys, kind="stable")
+        positions = np.searchsorted(self._index_ids, keys[order])
+        self._index_ids = np.insert(self._index_ids, positions, keys[order])
+        self._index_rows = np.insert(
+            self._index_rows, positions, (start + order).astype(np.int32)
+        )
+
+    def _append(self, records: List[tuple], keys: np.ndarray) -> int:
+        # Write rows to the columns without touching the id index
+        start, count = self._size, len(records)
+        self._grow(start + count)
+        rows = slice(start, start + count)
+        self._inst[rows] = [
+            self._intern(r[1], self._institutions, self._institution_codes) for r in records
+        ]
+        self._group[rows] = [_GROUP_CODES.get(r[2], _UNKNOWN_GROUP) for r in records]
+        self._comp[rows] = [
+            self._intern(r[3], self._components, self._component_codes) for r in records
+        ]
+        self._expiry[rows] = [_epoch(r[4]) for r in records]
+        self._alive[rows] = True
+        self._ids[rows] = keys
+        self._size += count
+        return start
+
+    def _build_index(self):
+        live = np.flatnonzero(self._alive[:self._size]).astype(np.int32)
+        order = np.argsort(self._ids[live], kind="stable")
+        self._index_rows = live[order]
+        self._index_ids = self._ids[self._index_rows]
+
+    def discard(self, unit_id):
+        self.discard_many([unit_id])
+
+    def discard_many(self, unit_ids: Iterable):
+        unit_ids = list(unit_ids)
+        if not unit_ids:
+            return
+        if self._journal is not None:
+            self._journal.append(("discard", unit_ids))
+        self._discard_keys(np.array([_key(u) for u in unit_ids], dtype=_ID_DTYPE))
+
+    def _discard_keys(self, keys: np.ndarray):
+        n_index = len(self._index_ids)
+        if n_index == 0 or keys.size == 0:
+            return
+        positions = np.searchsorted(self._index_ids, keys)
+        in_range = positions < n_index
+        positions, keys = positions[in_range], keys[in_range]
+        hits = np.unique(positions[self._index_ids[positions] == keys])
+        if hits.size == 0:
+            return
+        self._alive[self._index_rows[hits]] = False
+        self._index_ids = np.delete(self._index_ids, hits)
+        self._index_rows = np.delete(self._index_rows, hits)
+        self._dead += hits.size
+        if self._dead * 2 > self._size:
+            self._compact()
+
+    def _compact(self):
+        n_old = self._size
+        keep = np.flatnonzero(self._alive[:n_old])
+        n = keep.size
+        for col in self._columns():
+            col[:n] = col[keep]
+        self._alive[n:n_old] = False
+        remap = np.zeros(n_old, dtype=np.int32)
+        remap[keep] = np.arange(n, dtype=np.int32)
+        self._index_rows = remap[self._index_rows]
+        self._size = n
+        self._dead = 0
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < self.ttl_seconds
+        )
+
+    async def ensure_fresh(self):
+        """Load the snapshot on first use; once past the TTL, reload it in the background."""
+        if self._is_fresh():
+            return
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self.load()
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def _refresh(self):
+        try:
+            await self.load()
+        except Exception as e:
+            # Keep serving the old snapshot; the next match past the TTL retries
+            print(f"Stock snapshot reload failed: {e}")
+
+    async def load(self):
+        # Read raw documents with a projection rather than building BloodUnit models
+        from app.models.inventory import BloodUnit
+
+        started = time.monotonic()
+        staging = StockSnapshot(self.ttl_seconds)
+        # Local writes that land while the reload is in flight are replayed on top
+        self._journal = []
+        try:
+            # A full scan that already tolerates TTL staleness, so keep it off the primary
+            collection = BloodUnit.get_motor_collection().with_options(
+                read_preference=LISTING_READ_PREFERENCE
+            )
+            cursor = collection.find(
+                {"status": "Available"},
+                {"institution_id": 1, "blood_group": 1, "component_type": 1, "expiry_date": 1},
+                batch_size=_LOAD_BATCH,
+            )
+            batch = []
+            async for doc in cursor:
+                batch.append((doc["_id"], doc["institution_id"], doc["blood_group"],
+                              doc["component_type"], doc["expiry_date"]))
+                if len(batch) >= _LOAD_BATCH:
+                    staging._append(batch, np.array([_key(r[0]) for r in batch], dtype=_ID_DTYPE))
+                    batch = []
+                    # Let other requests run between batches
+                    await asyncio.sleep(0)
+            if batch:
+                staging._append(batch, np.array([_key(r[0]) for r in batch], dtype=_ID_DTYPE))
+            staging._build_index()
+        finally:
+            journal, self._journal = self._journal, None
+
+        for name in ("_size", "_dead", "_inst", "_group", "_comp", "_expiry", "_alive",
+                     "_ids", "_index_ids", "_index_rows", "_institutions",
+                     "_institution_codes", "_components", "_component_codes"):
+            setattr(self, name, getattr(staging, name))
+        for op, payload in journal:
+            if op == "add":
+                self.add_many(payload)
+            else:
+                self.discard_many(payload)
+        self._loaded_at = started
+
+    def match(self, blood_group: str, component_type: str, units: int,
+              expires_after: Optional[datetime] = None, exact: bool = False,
+              limit: int = 10) -> List[dict]:
+        """
+        Rank institutions by how much compatible stock of one component they hold.
+
+        Substitutes follow that component's compatibility table, or only the
+        requested group when ``exact`` is set. Institutions that can cover the
+        full request come first, then by most units, then by the
+        soonest-expiring unit so older stock is used first.
+        """
+        if component_type not in COMPONENT_COMPATIBILITY:
+            raise ValueError(f"Unknown component type: {component_type}")
+        table = COMPONENT_COMPATIBILITY[component_type]
+        groups = [blood_group] if exact else table.get(blood_group, [])
+        group_codes = [_GROUP_CODES[g] for g in groups if g in _GROUP_CODES]
+        n = self._size
+        if not group_codes or n == 0 or limit < 1:
+            return []
+
+        cutoff = _epoch(expires_after or datetime.now(timezone.utc))
+        mask = self._alive[:n] & (self._expiry[:n] > cutoff)
+        if len(group_codes) == 1:
+            mask &= self._group[:n] == group_codes[0]
+        else:
+            mask &= np.isin(self._group[:n], group_codes)
+        comp_code = self._component_codes.get(component_type)
+        if comp_code is None:
+            return []
+        mask &= self._comp[:n] == comp_code
+
+        inst = self._inst[:n][mask]
+        if inst.size == 0:
+            return []
+        expiry = self._expiry[:n][mask]
+        n_inst = len(self._institutions)
+
+        counts = np.bincount(inst, minlength=n_inst)
+        soonest = np.full(n_inst, _NO_EXPIRY, dtype=np.int64)
+        np.minimum.at(soonest, inst, expiry)
+
+        exact_code = _GROUP_CODES.get(blood_group)
+        exact_counts = np.bincount(
+            inst, weights=(self._group[:n][mask] == exact_code), minlength=n_inst
+        ).astype(np.int64)
+
+        candidates = np.flatnonzero(counts)
+        covers = counts[candidates] >= units
+        # lexsort: last key is primary
+        order = np.lexsort((soonest[candidates], -counts[candidates], ~covers))
+        ranked = candidates[order[:limit]]
+
+        return [
+            {
+                "institution_id": self._institutions[i],
+                "available_units": int(counts[i]),
+                "exact_match_units": int(exact_counts[i]),
+                "can_cover": bool(counts[i] >= units),
+                "soonest_expiry": datetime.fromtimestamp(int(soonest[i]), tz=timezone.utc),
+            }
+            for i in ranked
+        ]
+
+
+# Process-wide snapshot, loaded lazily by /inventory/match and kept current by inventory writes
+stock_snapshot = StockSnapshot()
@@ -1,6 +1,12 @@
 import os
+import threading
+from collections import defaultdict
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo import monitoring
 from beanie import init_beanie
+from beanie.odm.utils.parsing import parse_obj
 from dotenv import load_dotenv
 
 # Import your new models!
@@ -10,20 +16,140 @@ from app.models.requests import BloodRequest
 
 load_dotenv()
 
+# Pool sizing and timeouts, overridable per deployment
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+
+# Write concern: "majority", or a node count such as "1"
+WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "majority")
+RETRY_WRITES = os.getenv("MONGO_RETRY_WRITES", "true").lower() in ("1", "true", "yes")
+
+# Listing endpoints may read from secondaries; MongoDB requires max staleness >= 90s
+READ_MAX_STALENESS_S = max(int(os.getenv("MONGO_READ_MAX_STALENESS_S", "90")), 90)
+LISTING_READ_PREFERENCE = SecondaryPreferred(max_staleness=READ_MAX_STALENESS_S)
+
+client: AsyncIOMotorClient = None
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks checked-out and waiting connections per server for the saturation gauge."""
+
+    def __init__(self):
+        # Motor runs pymongo on executor threads, so events can arrive concurrently
+        self._lock = threading.Lock()
+        self.checked_out = defaultdict(int)
+        self.waiting = defaultdict(int)
+        self.open = defaultdict(int)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        # Connections out during the clear still report checked_in/closed later
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.checked_out.pop(event.address, None)
+            self.waiting.pop(event.address, None)
+            self.open.pop(event.address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open[event.address] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open[event.address] -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting[event.address] += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting[event.address] -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting[event.address] -= 1
+            self.checked_out[event.address] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out[event.address] -= 1
+
+    def snapshot(self) -> dict:
+        servers = {}
+        with self._lock:
+            for address in set(self.checked_out) | set(self.waiting) | set(self.open):
+                in_use = self.checked_out[address]
+                servers[f"{address[0]}:{address[1]}"] = {
+                    "checked_out": in_use,
+                    "waiting": self.waiting[address],
+                    "open": self.open[address],
+                    "saturation": round(in_use / MAX_POOL_SIZE, 3),
+                }
+        return {
+            "max_pool_size": MAX_POOL_SIZE,
+            "saturation": max((s["saturation"] for s in servers.values()), default=0.0),
+            "servers": servers,
+        }
+
+
+pool_monitor = PoolMonitor()
+
+
 async def init_db():
+    global client
     mongo_uri = os.getenv("MONGO_URI")
     if not mongo_uri:
         raise ValueError("MONGO_URI environment variable not set.")
+    if MIN_POOL_SIZE > MAX_POOL_SIZE:
+        raise ValueError("MONGO_MIN_POOL_SIZE cannot be greater than MONGO_MAX_POOL_SIZE.")
+
+    # Allocation reads and all writes stay on the primary by default
+    client = AsyncIOMotorClient(
+        mongo_uri,
+        maxPoolSize=MAX_POOL_SIZE,
+        minPoolSize=MIN_POOL_SIZE,
+        maxIdleTimeMS=MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=SOCKET_TIMEOUT_MS,
+        read_preference=ReadPreference.PRIMARY,
+        w=int(WRITE_CONCERN) if WRITE_CONCERN.isdigit() else WRITE_CONCERN,
+        retryWrites=RETRY_WRITES,
+        event_listeners=[pool_monitor],
+    )
 
-    client = AsyncIOMotorClient(mongo_uri)
-    
     # Register the models
     await init_beanie(
-        database=client.lifelink, 
+        database=client.lifelink,
         document_models=[
-            User, 
+            User,
             BloodUnit,
             BloodRequest
-        ] 
+        ]
     )
-    print("MongoDB successfully connected and Beanie initialized! 🩸")
\ No newline at end of file
+    print("MongoDB successfully connected and Beanie initialized! 🩸")
+
+
+async def find_for_listing(model, query: dict = None, sort: list = None,
+                           read_preference=LISTING_READ_PREFERENCE):
+    """Run a dashboard listing query with its own read preference (Beanie's find() has none)."""
+    collection = model.get_motor_collection().with_options(read_preference=read_preference)
+    docs = await collection.find(query or {}, sort=sort).to_list(length=None)
+    return [parse_obj(model, doc) for doc in docs]
@@ -1,7 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.database import init_db
+from app.database import init_db, pool_monitor
+from app.core.consistency import LAST_WRITE_HEADER
+from app.core.security import get_current_user
 from app.routers import auth, ai_vision, requests
 
 # Lifespan context manager handles the startup and shutdown of the DB connection
@@ -34,6 +36,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend read the write marker it echoes back on listing calls
+    expose_headers=[LAST_WRITE_HEADER],
 )
 
 # Root/Health check endpoint
@@ -45,6 +49,11 @@ async def root():
         "version": "1.0.0"
     }
 
+# MongoDB connection pool saturation gauge for sizing workers against the cluster
+@app.get("/health/db-pool")
+async def db_pool(current_user: dict = Depends(get_current_user)):
+    return pool_monitor.snapshot()
+
 # Unified Authentication Router (Smart Identifier Gateway)
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 
@@ -54,4 +63,4 @@ app.include_router(requests.router, prefix="/requests", tags=["Blood Requests"])
 from app.routers import inventory
 app.include_router(inventory.router, prefix="/inventory", tags=["Inventory"])
 
-# Note: You can add Geo-Spatial or Inventory routers here as you build them
\ No newline at end of file
+# Note: You can add Geo-Spatial or Inventory routers here as you build them
\ No newline at end of file
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from app.models.inventory import BloodUnit
 from app.models.users import User
 from app.core.security import get_current_user
+from app.core.stock_index import stock_snapshot, BLOOD_GROUPS, COMPONENT_TYPES
+from app.database import find_for_listing
+from app.core.consistency import listing_read_preference, mark_write
 from datetime import datetime, timedelta, timezone
 import random
 
@@ -16,14 +19,49 @@ class BloodUnitCreate(BaseModel):
     collection_date: datetime = None
 
 @router.get("/", response_model=List[BloodUnit])
-async def get_inventory(current_user: dict = Depends(get_current_user)):
+async def get_inventory(
+    current_user: dict = Depends(get_current_user),
+    read_preference = Depends(listing_read_preference),
+):
     # In a real app, filtering by institution_id would happen here
     # For this demo, we return all units to show the "Network" view
-    units = await BloodUnit.find_all().to_list()
+    units = await find_for_listing(BloodUnit, read_preference=read_preference)
     return units
 
+@router.get("/match")
+async def match_stock(
+    blood_group: str,
+    component_type: str,
+    units: int = Query(1, ge=1),
+    expires_after: Optional[datetime] = None,
+    exact: bool = False,
+    limit: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+):
+    # Served from the in-memory columnar snapshot, no per-unit document loads
+    if blood_group not in BLOOD_GROUPS:
+        raise HTTPException(status_code=400, detail=f"Unknown blood group: {blood_group}")
+    # Compatibility differs per component, so never pool components together
+    if component_type not in COMPONENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown component type: {component_type}")
+    await stock_snapshot.ensure_fresh()
+    matches = stock_snapshot.match(
+        blood_group,
+        component_type,
+        units,
+        expires_after=expires_after,
+        exact=exact,
+        limit=limit,
+    )
+    return {
+        "blood_group": blood_group,
+        "component_type": component_type,
+        "units": units,
+        "institutions": matches,
+    }
+
 @router.post("/add", status_code=status.HTTP_201_CREATED)
-async def add_units(data: BloodUnitCreate, current_user: dict = Depends(get_current_user)):
+async def add_units(data: BloodUnitCreate, response: Response, current_user: dict = Depends(get_current_user)):
     user = await User.find_one(User.smart_id == current_user["sub"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -54,7 +92,11 @@ async def add_units(data: BloodUnitCreate, current_user: dict = Depends(get_curr
         new_units.append(unit)
 
     if new_units:
-        await BloodUnit.insert_many(new_units)
+        result = await BloodUnit.insert_many(new_units)
+        for u, inserted_id in zip(new_units, result.inserted_ids):
+            u.id = inserted_id
+        stock_snapshot.add_units(new_units)
+        mark_write(response)
         
         # --- Back-in-Stock Trigger ---
         # Check if any Pending requests can now be fulfilled
@@ -85,6 +127,7 @@ async def add_units(data: BloodUnitCreate, current_user: dict = Depends(get_curr
                  for u in units_to_reserve:
                      u.status = "Reserved"
                      await u.save()
+                 stock_snapshot.discard_many(u.id for u in units_to_reserve)
                 
                  req.status = "Approved"
                  req.fulfilled_by = "LifeLink Auto-Allocation"
@@ -94,9 +137,11 @@ async def add_units(data: BloodUnitCreate, current_user: dict = Depends(get_curr
     return {"message": f"Successfully added {data.quantity} units", "units": new_units}
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_unit(id: str, current_user: dict = Depends(get_current_user)):
+async def delete_unit(id: str, response: Response, current_user: dict = Depends(get_current_user)):
     unit = await BloodUnit.get(id)
     if not unit:
         raise HTTPException(status_code=404, detail="Unit not found")
     await unit.delete()
+    stock_snapshot.discard(unit.id)
+    mark_write(response)
     return None
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Response
 from pydantic import BaseModel
 from app.models.requests import BloodRequest
 from app.models.users import User
 from app.models.inventory import BloodUnit
 from app.core.security import get_current_user
+from app.core.stock_index import stock_snapshot
+from app.database import find_for_listing
+from app.core.consistency import listing_read_preference, mark_write
 from beanie.operators import In
 
 router = APIRouter()
@@ -15,7 +18,7 @@ class RequestCreate(BaseModel):
     urgency: str = "Standard"
 
 @router.post("/create", status_code=status.HTTP_201_CREATED)
-async def create_request(req: RequestCreate, current_user: dict = Depends(get_current_user)):
+async def create_request(req: RequestCreate, response: Response, current_user: dict = Depends(get_current_user)):
     # Find the user making the request
     user = await User.find_one(User.smart_id == current_user["sub"])
     if not user:
@@ -42,6 +45,7 @@ async def create_request(req: RequestCreate, current_user: dict = Depends(get_cu
         for unit in available_units:
             unit.status = "Reserved"
             await unit.save()
+        stock_snapshot.discard_many(u.id for u in available_units)
     else:
         # 2. Broadcast to Donors
         # Logic: Same Blood Group OR O- (Universal)
@@ -68,6 +72,7 @@ async def create_request(req: RequestCreate, current_user: dict = Depends(get_cu
     )
     
     await new_request.insert()
+    mark_write(response)
     
     return {
         "message": "Blood request processed", 
@@ -86,23 +91,34 @@ async def get_my_requests(current_user: dict = Depends(get_current_user)):
     return requests
 
 @router.get("/all")
-async def get_all_requests(current_user: dict = Depends(get_current_user)):
+async def get_all_requests(
+    current_user: dict = Depends(get_current_user),
+    read_preference = Depends(listing_read_preference),
+):
     # Accessible by Blood Bank / Hospital
-    requests = await BloodRequest.find_all().sort(-BloodRequest.created_at).to_list()
+    # Dashboard listing, served from a secondary unless the caller just wrote
+    requests = await find_for_listing(
+        BloodRequest, sort=[("created_at", -1)], read_preference=read_preference
+    )
     return requests
 
 @router.get("/broadcasts")
-async def get_broadcasts(current_user: dict = Depends(get_current_user)):
+async def get_broadcasts(
+    current_user: dict = Depends(get_current_user),
+    read_preference = Depends(listing_read_preference),
+):
     # Requests broadcasted to THIS user
     user_id = current_user["sub"]
-    requests = await BloodRequest.find(
-        In(BloodRequest.broadcasted_to, [user_id]),
-        BloodRequest.status == "Pending"
-    ).sort(-BloodRequest.created_at).to_list()
+    requests = await find_for_listing(
+        BloodRequest,
+        {"broadcasted_to": {"$in": [user_id]}, "status": "Pending"},
+        sort=[("created_at", -1)],
+        read_preference=read_preference
+    )
     return requests
 
 @router.post("/{req_id}/fulfill")
-async def fulfill_request(req_id: str, current_user: dict = Depends(get_current_user)):
+async def fulfill_request(req_id: str, response: Response, current_user: dict = Depends(get_current_user)):
     # Manual Approval by Blood Bank
     req = await BloodRequest.get(req_id)
     if not req:
@@ -124,14 +140,16 @@ async def fulfill_request(req_id: str, current_user: dict = Depends(get_current_
     for unit in available_units:
         unit.status = "Reserved"
         await unit.save()
+    stock_snapshot.discard_many(u.id for u in available_units)
 
     req.status = "Approved"
     req.fulfilled_by = "Blood Bank (Manual)"
     await req.save()
+    mark_write(response)
     return {"message": "Request Approved Manually"}
 
 @router.post("/{req_id}/dispatch")
-async def dispatch_request(req_id: str, current_user: dict = Depends(get_current_user)):
+async def dispatch_request(req_id: str, response: Response, current_user: dict = Depends(get_current_user)):
     # Distribution Step
     req = await BloodRequest.get(req_id)
     if not req:
@@ -144,10 +162,11 @@ async def dispatch_request(req_id: str, current_user: dict = Depends(get_current
     # For now, we update the request status.
     req.status = "Dispatched"
     await req.save()
+    mark_write(response)
     return {"message": "Blood Units Dispatched"}
 
 @router.post("/{req_id}/donate")
-async def donate_request(req_id: str, current_user: dict = Depends(get_current_user)):
+async def donate_request(req_id: str, response: Response, current_user: dict = Depends(get_current_user)):
     # Donor accepts request
     req = await BloodRequest.get(req_id)
     if not req:
@@ -161,4 +180,5 @@ async def donate_request(req_id: str, current_user: dict = Depends(get_current_u
     req.status = "Fulfilled" # Or "Donor Accepted"
     req.fulfilled_by = f"Donor: {user.full_name}"
     await req.save()
+    mark_write(response)
     return {"message": "Thank you for donating!"}
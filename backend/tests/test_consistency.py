@@ -0,0 +1,37 @@
+import time
+from fastapi import Response
+from pymongo import ReadPreference
+
+from app.core import consistency
+from app.database import LISTING_READ_PREFERENCE
+
+
+def stamp():
+    response = Response()
+    consistency.mark_write(response)
+    return response.headers[consistency.LAST_WRITE_HEADER]
+
+
+def test_listings_read_primary_right_after_a_signed_write():
+    assert consistency.listing_read_preference(stamp()) == ReadPreference.PRIMARY
+
+
+def test_missing_or_garbage_stamp_reads_secondary():
+    assert consistency.listing_read_preference(None) == LISTING_READ_PREFERENCE
+    assert consistency.listing_read_preference("garbage") == LISTING_READ_PREFERENCE
+    assert consistency.listing_read_preference("abc.def") == LISTING_READ_PREFERENCE
+
+
+def test_forged_or_tampered_stamp_reads_secondary():
+    now_ms = str(int(time.time() * 1000))
+    assert consistency.listing_read_preference(now_ms) == LISTING_READ_PREFERENCE
+    assert consistency.listing_read_preference(f"{now_ms}.{'0' * 64}") == LISTING_READ_PREFERENCE
+    written_at, signature = stamp().split(".")
+    later = str(int(written_at) + 1)
+    assert consistency.listing_read_preference(f"{later}.{signature}") == LISTING_READ_PREFERENCE
+
+
+def test_old_stamp_reads_secondary():
+    old = str(int(time.time() * 1000) - consistency.PRIMARY_AFTER_WRITE_WINDOW_MS - 1000)
+    signed = f"{old}.{consistency._sign(old)}"
+    assert consistency.listing_read_preference(signed) == LISTING_READ_PREFERENCE
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from datetime import datetime
+from bson import DBRef, ObjectId
+from beanie import Link, init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app import database
+from app.models.inventory import BloodUnit
+from app.models.requests import BloodRequest
+from app.models.users import User
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.read_preference = None
+
+    def with_options(self, read_preference=None):
+        self.read_preference = read_preference
+        return self
+
+    def find(self, query, sort=None):
+        self.query = query
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+async def init_models():
+    # Beanie only needs the server version; nothing here talks to Mongo
+    db = AsyncIOMotorClient("mongodb://127.0.0.1:1").lifelink
+
+    async def command(*args, **kwargs):
+        return {"version": "7.0.0"}
+
+    db.command = command
+    await init_beanie(database=db, document_models=[User, BloodUnit, BloodRequest], skip_indexes=True)
+
+
+def test_find_for_listing_parses_raw_request_with_dbref(monkeypatch):
+    requester_id = ObjectId()
+    raw = {
+        "_id": ObjectId(),
+        "requester": DBRef("users", requester_id),
+        "blood_group": "O-",
+        "units_needed": 2,
+        "status": "Pending",
+        "broadcasted_to": ["9876543210"],
+        "created_at": datetime(2026, 1, 1),
+    }
+    collection = FakeCollection([raw])
+
+    async def run():
+        await init_models()
+        monkeypatch.setattr(BloodRequest, "get_motor_collection", classmethod(lambda cls: collection))
+        return await database.find_for_listing(BloodRequest, {"status": "Pending"})
+
+    (request,) = asyncio.run(run())
+    assert isinstance(request, BloodRequest)
+    assert request.id == raw["_id"]
+    assert isinstance(request.requester, Link)
+    assert request.requester.ref.id == requester_id
+    assert collection.read_preference == database.LISTING_READ_PREFERENCE
+
+
+def test_pool_clear_does_not_reset_checked_out():
+    class Event:
+        address = ("db", 27017)
+
+    monitor = database.PoolMonitor()
+    monitor.connection_checked_out(Event)
+    monitor.connection_checked_out(Event)
+    monitor.pool_cleared(Event)
+    assert monitor.checked_out[Event.address] == 2
+    monitor.connection_checked_in(Event)
+    assert monitor.snapshot()["servers"]["db:27017"]["checked_out"] == 1
+
+
+def test_pool_counters_survive_concurrent_events():
+    class Event:
+        address = ("db", 27017)
+
+    monitor = database.PoolMonitor()
+
+    def churn():
+        for _ in range(10_000):
+            monitor.connection_check_out_started(Event)
+            monitor.connection_checked_out(Event)
+            monitor.connection_checked_in(Event)
+
+    threads = [threading.Thread(target=churn) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server = monitor.snapshot()["servers"]["db:27017"]
+    assert server["checked_out"] == 0 and server["waiting"] == 0
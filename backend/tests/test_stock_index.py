@@ -0,0 +1,206 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from app.core import stock_index
+from app.core.stock_index import StockSnapshot
+from app.models.inventory import BloodUnit
+
+NOW = datetime.now(timezone.utc)
+SOON = NOW + timedelta(days=10)
+
+
+def assert_consistent(snapshot):
+    # Every live row is indexed exactly once, and the index points back at it
+    n = snapshot._size
+    live_rows = np.flatnonzero(snapshot._alive[:n])
+    assert len(snapshot) == live_rows.size
+    assert np.all(snapshot._index_ids[:-1] <= snapshot._index_ids[1:])
+    assert sorted(snapshot._index_rows.tolist()) == live_rows.tolist()
+    assert np.array_equal(snapshot._ids[snapshot._index_rows], snapshot._index_ids)
+
+
+def stock(snapshot, institution, group, component, count, expiry=SOON):
+    for _ in range(count):
+        snapshot.add(ObjectId(), institution, group, component, expiry)
+
+
+def test_ranks_covering_institutions_first_then_count_then_expiry():
+    s = StockSnapshot()
+    stock(s, "Big Bank", "O-", "Packed Red Cells", 3, NOW + timedelta(days=20))
+    stock(s, "Early Bank", "O-", "Packed Red Cells", 2, NOW + timedelta(days=2))
+    stock(s, "Late Bank", "O-", "Packed Red Cells", 2, NOW + timedelta(days=10))
+    stock(s, "Small Bank", "O-", "Packed Red Cells", 1, NOW + timedelta(days=1))
+
+    ranked = s.match("O-", "Packed Red Cells", 2)
+    assert [r["institution_id"] for r in ranked] == [
+        "Big Bank", "Early Bank", "Late Bank", "Small Bank"
+    ]
+    assert [r["can_cover"] for r in ranked] == [True, True, True, False]
+    assert [r["institution_id"] for r in s.match("O-", "Packed Red Cells", 2, limit=2)] == [
+        "Big Bank", "Early Bank"
+    ]
+
+
+def test_components_are_never_pooled():
+    s = StockSnapshot()
+    stock(s, "Bank", "O-", "Plasma", 3)
+    stock(s, "Bank", "O-", "Packed Red Cells", 3)
+
+    (red_cells,) = s.match("AB+", "Packed Red Cells", 6)
+    assert red_cells["available_units"] == 3
+    assert not red_cells["can_cover"]
+
+
+def test_red_cells_use_o_negative_as_universal_donor():
+    s = StockSnapshot()
+    stock(s, "Bank", "A+", "Packed Red Cells", 1)
+    stock(s, "Bank", "O-", "Packed Red Cells", 1)
+    stock(s, "Other Bank", "B+", "Packed Red Cells", 1)
+
+    (only,) = s.match("A+", "Packed Red Cells", 2)
+    assert only["institution_id"] == "Bank"
+    assert only["available_units"] == 2
+    assert only["exact_match_units"] == 1
+    assert s.match("A+", "Packed Red Cells", 2, exact=True)[0]["available_units"] == 1
+
+
+def test_plasma_compatibility_is_reversed():
+    s = StockSnapshot()
+    stock(s, "O Bank", "O-", "Plasma", 3)
+    stock(s, "AB Bank", "AB+", "Plasma", 3)
+
+    # AB recipients can only take AB plasma, never O plasma
+    assert [r["institution_id"] for r in s.match("AB+", "Plasma", 3)] == ["AB Bank"]
+    # O recipients can take any plasma, Rh does not apply
+    assert {r["institution_id"] for r in s.match("O+", "Plasma", 3)} == {"O Bank", "AB Bank"}
+
+
+def test_whole_blood_is_abo_identical():
+    s = StockSnapshot()
+    stock(s, "O Bank", "O-", "Whole Blood", 2)
+    stock(s, "A Bank", "A-", "Whole Blood", 2)
+
+    assert [r["institution_id"] for r in s.match("A+", "Whole Blood", 2)] == ["A Bank"]
+    assert s.match("AB+", "Whole Blood", 1) == []
+
+
+def test_platelets_keep_rh_negative_recipients_on_rh_negative_units():
+    s = StockSnapshot()
+    stock(s, "Pos Bank", "AB+", "Platelets", 1)
+    stock(s, "Neg Bank", "AB-", "Platelets", 1)
+
+    assert [r["institution_id"] for r in s.match("A-", "Platelets", 1)] == ["Neg Bank"]
+
+
+def test_unknown_component_is_rejected():
+    with pytest.raises(ValueError):
+        StockSnapshot().match("O-", "Red Cells", 1)
+
+
+def test_expiry_cutoff_accepts_naive_and_aware_datetimes():
+    s = StockSnapshot()
+    # Mongo returns naive UTC datetimes
+    s.add(ObjectId(), "Bank", "O+", "Platelets", (NOW + timedelta(days=3)).replace(tzinfo=None))
+
+    assert s.match("O+", "Platelets", 1, expires_after=NOW + timedelta(days=2))
+    assert not s.match("O+", "Platelets", 1, expires_after=NOW + timedelta(days=4))
+    assert s.match("O+", "Platelets", 1, expires_after=(NOW + timedelta(days=2)).replace(tzinfo=None))
+    assert not s.match("O+", "Whole Blood", 1)
+
+
+def test_add_discard_and_compact_keep_index_consistent():
+    s = StockSnapshot()
+    ids = [ObjectId() for _ in range(2000)]
+    s.add_many((i, f"Bank {n % 7}", "O-", "Whole Blood", SOON) for n, i in enumerate(ids))
+    assert_consistent(s)
+
+    s.discard_many(str(i) for i in ids[:500])
+    assert len(s) == 1500 and s._dead == 500
+    assert_consistent(s)
+
+    # Crossing half the table triggers compaction
+    s.discard_many(ids[500:1200])
+    assert len(s) == 800 and s._dead == 0 and s._size == 800
+    assert_consistent(s)
+
+    # Unknown or already removed ids are ignored
+    s.discard(ids[0])
+    s.discard(ObjectId())
+    assert len(s) == 800
+
+    # Re-adding a live unit replaces it instead of duplicating it
+    s.add(ids[1500], "Moved Bank", "O-", "Whole Blood", SOON)
+    assert len(s) == 800
+    assert_consistent(s)
+    assert s.match("O-", "Whole Blood", 1, limit=100)[-1]["institution_id"] == "Moved Bank"
+
+    s.discard_many(ids[1200:])
+    assert len(s) == 0
+    assert s.match("O-", "Whole Blood", 1) == []
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.read_preference = None
+
+    def with_options(self, read_preference=None):
+        self.read_preference = read_preference
+        return self
+
+    def find(self, *args, **kwargs):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in list(self.docs):
+            await asyncio.sleep(0)
+            yield doc
+
+
+def unit_doc(group="O-", institution="Bank"):
+    return {"_id": ObjectId(), "institution_id": institution, "blood_group": group,
+            "component_type": "Whole Blood", "expiry_date": SOON.replace(tzinfo=None)}
+
+
+def test_load_builds_index_reads_secondary_and_replays_local_writes(monkeypatch):
+    docs = [unit_doc() for _ in range(25)]
+    collection = FakeCollection(docs)
+    monkeypatch.setattr(BloodUnit, "get_motor_collection", classmethod(lambda cls: collection))
+    monkeypatch.setattr(stock_index, "_LOAD_BATCH", 10)
+    s = StockSnapshot()
+    added = ObjectId()
+
+    async def write_during_load():
+        await asyncio.sleep(0)
+        s.add(added, "Bank", "O-", "Whole Blood", SOON)
+        s.discard(docs[0]["_id"])
+
+    async def run():
+        await asyncio.gather(s.ensure_fresh(), write_during_load())
+
+    asyncio.run(run())
+    assert collection.read_preference == stock_index.LISTING_READ_PREFERENCE
+    assert len(s) == 25
+    assert_consistent(s)
+
+
+def test_stale_snapshot_keeps_serving_while_reloading_in_background(monkeypatch):
+    docs = [unit_doc()]
+    collection = FakeCollection(docs)
+    monkeypatch.setattr(BloodUnit, "get_motor_collection", classmethod(lambda cls: collection))
+    s = StockSnapshot(ttl_seconds=0)
+
+    async def run():
+        await s.ensure_fresh()
+        assert len(s) == 1
+        docs.append(unit_doc())
+        # Past the TTL: returns at once with the old data, reload runs behind it
+        await s.ensure_fresh()
+        assert len(s) == 1
+        await s._refresh_task
+        assert len(s) == 2
+
+    asyncio.run(run())
@@ -10,6 +10,11 @@ api.interceptors.request.use(
         if (token) {
             config.headers.Authorization = `Bearer ${token}`;
         }
+        // Echo our last write time so listings read from the primary until replicas catch up
+        const lastWrite = localStorage.getItem('lastWrite');
+        if (lastWrite) {
+            config.headers['X-LifeLink-Last-Write'] = lastWrite;
+        }
         return config;
     },
     (error) => {
@@ -17,4 +22,12 @@ api.interceptors.request.use(
     }
 );
 
+api.interceptors.response.use((response) => {
+    const lastWrite = response.headers['x-lifelink-last-write'];
+    if (lastWrite) {
+        localStorage.setItem('lastWrite', lastWrite);
+    }
+    return response;
+});
+
 export default api;